@@ -1,15 +1,52 @@
-from fastapi import FastAPI, HTTPException
+import functools
+from contextlib import asynccontextmanager
+
+import anyio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, List, Dict, Any
 
-from services.r2 import presign_put, presign_get, put_json, get_json
+from services.r2 import (
+    presign_put,
+    presign_get,
+    put_json,
+    get_json,
+    get_json_first,
+    upload_fileobj,
+    start_multipart_upload,
+    upload_part,
+    complete_multipart_upload,
+    abort_multipart_upload,
+    PRESIGN_REUSE_MARGIN_SECONDS,
+)
 from services.jobs import create_job, get_job, save_job, results_key, video_key as make_video_key
 
 
-app = FastAPI(title="RoadEye API")
+# Sync (def) endpoints run in anyio's worker threadpool; every R2 call blocks one thread,
+# so this caps how many requests can be waiting on R2 at once (anyio default: 40).
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "100"))
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
+
+
+app = FastAPI(title="RoadEye API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# S3 multipart parts must be >= 5 MB (except the last one)
+RAW_UPLOAD_PART_SIZE = 8 << 20
+
+# Results are double-written by the RunPod worker; after this long the canonical
+# copy is certainly visible and a single GET is enough.
+RESULTS_ALT_RACE_SECONDS = 60
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,13 +57,33 @@ app.add_middleware(
 )
 
 
+@functools.lru_cache(maxsize=32)
 def require_env(name: str) -> str:
+    # env is fixed for the process lifetime; a missing var raises and is not cached
     v = os.getenv(name)
     if not v:
         raise RuntimeError(f"Missing required env var: {name}")
     return v
 
 
+@functools.lru_cache(maxsize=1)
+def runpod_session() -> requests.Session:
+    # Shared keep-alive pool to api.runpod.ai: submits reuse the TCP+TLS connection.
+    s = requests.Session()
+    s.headers.update({"Authorization": f"Bearer {require_env('RUNPOD_API_KEY')}", "Content-Type": "application/json"})
+    s.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=THREADPOOL_SIZE))
+    return s
+
+
+def mark_uploaded(job: Dict[str, Any], video_key: str) -> Dict[str, Any]:
+    # shared tail of every upload route
+    job["video_key"] = video_key
+    job["status"] = "uploaded"
+    job["error"] = None
+    save_job(job)
+    return {"job_id": job["job_id"], "status": "uploaded", "video_key": video_key}
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -79,22 +136,17 @@ def api_upload_complete(job_id: str, payload: dict):
     if not vkey:
         raise HTTPException(status_code=400, detail="video_key is required")
 
-    job["video_key"] = vkey
-    job["status"] = "uploaded"
-    job["error"] = None
-    save_job(job)
-
-    return {"job_id": job_id, "status": "uploaded", "video_key": vkey}
+    return mark_uploaded(job, vkey)
 
 
-# Keep legacy upload route working (fallback): client uploads to backend, backend writes to R2 via presign PUT
-# This avoids local disk dependency.
+# Keep legacy upload route working (fallback): client uploads to backend, backend streams to R2
+# via multipart upload. This avoids local disk dependency and never holds the whole file in RAM.
 from fastapi import UploadFile, File  # noqa: E402
 
 
 @app.post("/jobs/{job_id}/upload")
 async def legacy_upload(job_id: str, file: Optional[UploadFile] = File(None), video: Optional[UploadFile] = File(None)):
-    job = get_job(job_id)
+    job = await run_in_threadpool(get_job, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
 
@@ -105,19 +157,54 @@ async def legacy_upload(job_id: str, file: Optional[UploadFile] = File(None), vi
     filename = upload.filename or "upload.mp4"
     content_type = upload.content_type or "application/octet-stream"
     key = make_video_key(job_id, filename)
-    url = presign_put(key=key, content_type=content_type, expires_seconds=3600)
 
-    # stream from client upload to R2 PUT
-    resp = requests.put(url, data=await upload.read(), headers={"Content-Type": content_type})
-    if not resp.ok:
-        raise HTTPException(status_code=500, detail=f"Failed to upload to R2: {resp.status_code}")
+    # stream from the spooled client upload to R2 in parts, off the event loop
+    try:
+        await run_in_threadpool(upload_fileobj, key, upload.file, content_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload to R2: {e}")
 
-    job["video_key"] = key
-    job["status"] = "uploaded"
-    job["error"] = None
-    save_job(job)
+    return await run_in_threadpool(mark_uploaded, job, key)
 
-    return {"job_id": job_id, "status": "uploaded", "video_key": key}
+
+# Raw streaming upload: client PUTs the file body directly (no multipart form), backend pipes
+# request chunks to an R2 multipart upload without parsing or spooling the body.
+@app.put("/jobs/{job_id}/upload-raw")
+async def api_upload_raw(job_id: str, request: Request, filename: Optional[str] = None):
+    job = await run_in_threadpool(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    filename = filename or job.get("filename_hint") or "upload.mp4"
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    key = make_video_key(job_id, filename)
+
+    upload_id = await run_in_threadpool(start_multipart_upload, key, content_type)
+    parts: List[Dict[str, Any]] = []
+    buf = bytearray()
+    try:
+        async for chunk in request.stream():
+            buf.extend(chunk)
+            # exactly RAW_UPLOAD_PART_SIZE per part: R2 rejects non-trailing parts of unequal length
+            while len(buf) >= RAW_UPLOAD_PART_SIZE:
+                part = bytes(buf[:RAW_UPLOAD_PART_SIZE])
+                del buf[:RAW_UPLOAD_PART_SIZE]
+                parts.append(await run_in_threadpool(upload_part, key, upload_id, len(parts) + 1, part))
+
+        if not parts and not buf:
+            await run_in_threadpool(abort_multipart_upload, key, upload_id)
+            raise HTTPException(status_code=400, detail="empty upload body")
+
+        if buf:
+            parts.append(await run_in_threadpool(upload_part, key, upload_id, len(parts) + 1, bytes(buf)))
+        await run_in_threadpool(complete_multipart_upload, key, upload_id, parts)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await run_in_threadpool(abort_multipart_upload, key, upload_id)
+        raise HTTPException(status_code=500, detail=f"Failed to upload to R2: {e}")
+
+    return await run_in_threadpool(mark_uploaded, job, key)
 
 
 @app.post("/jobs/{job_id}/submit")
@@ -138,28 +225,26 @@ def api_submit(job_id: str):
     if job.get("status") == "completed":
         return {"job_id": job_id, "status": "completed"}
 
-    # mark queued before submission
+    # mark queued before submission; this is the only write on the happy path
     job["status"] = "queued"
     job["error"] = None
     save_job(job)
 
-    runpod_api_key = require_env("RUNPOD_API_KEY")
     endpoint_id = require_env("RUNPOD_ENDPOINT_ID")
 
     # RunPod REST submit
     submit_url = f"https://api.runpod.ai/v2/{endpoint_id}/run"
-    headers = {"Authorization": f"Bearer {runpod_api_key}", "Content-Type": "application/json"}
     payload = {"input": {"job_id": job_id, "video_key": job["video_key"]}}
 
-    r = requests.post(submit_url, headers=headers, json=payload, timeout=30)
+    r = runpod_session().post(submit_url, json=payload, timeout=30)
     if not r.ok:
         job["status"] = "failed"
         job["error"] = f"RunPod submit failed: {r.status_code}"
         save_job(job)
         raise HTTPException(status_code=500, detail=job["error"])
 
-    job["status"] = "running"
-    save_job(job)
+    # The RunPod worker marks the job running itself; writing "running" here as well
+    # cost an extra PUT and could clobber a fast worker's "completed".
     return {"job_id": job_id, "status": job["status"]}
 
 
@@ -176,16 +261,30 @@ def api_results(job_id: str):
         raise HTTPException(status_code=404, detail="job not found")
 
     rk = job.get("results_key") or results_key(job_id)
-    data = get_json(rk)
+    alt = job.get("results_key_alt")
+    finished_at = job.get("finished_at") or 0
+    fresh = time.time() - finished_at < RESULTS_ALT_RACE_SECONDS
+    if alt and fresh:
+        # freshly written: race both copies, whichever is visible first wins
+        data = get_json_first([rk, alt])
+    else:
+        data = get_json(rk)
 
     status = job.get("status")
     if data is None:
-        if status in ("created", "uploaded", "queued", "running"):
-            return JSONResponse(status_code=202, content={"job_id": job_id, "status": status, "message": "Results not ready yet"})
+        # "completed": the worker writes the job and results blobs in parallel, so the
+        # results object can trail the status by a moment; after the race window it is
+        # really missing (failed PUT, deleted) and clients should stop polling
+        if status in ("created", "uploaded", "queued", "running") or (status == "completed" and fresh):
+            return ORJSONResponse(status_code=202, content={"job_id": job_id, "status": status, "message": "Results not ready yet"})
         if status == "failed":
             raise HTTPException(status_code=500, detail=job.get("error") or "job failed")
         raise HTTPException(status_code=404, detail="results not found")
 
+    # parquet results: the JSON is a manifest; hand out a URL for the detections file
+    if data.get("detections_key"):
+        return {"job_id": job_id, "results": data, "detections_url": presign_get(data["detections_key"], expires_seconds=3600)}
+
     return {"job_id": job_id, "results": data}
 
 
@@ -197,4 +296,8 @@ def api_video(job_id: str):
     vkey = job.get("video_key")
     if not vkey:
         raise HTTPException(status_code=404, detail="video not uploaded")
-    return {"job_id": job_id, "video_url": presign_get(vkey, expires_seconds=3600)}
+    # presign_get reuses a URL for at least PRESIGN_REUSE_MARGIN_SECONDS, so browsers may cache it too
+    return ORJSONResponse(
+        content={"job_id": job_id, "video_url": presign_get(vkey, expires_seconds=3600)},
+        headers={"Cache-Control": f"private, max-age={PRESIGN_REUSE_MARGIN_SECONDS // 2}"},
+    )
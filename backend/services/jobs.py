@@ -1,20 +1,42 @@
+import hashlib
+import os
+import threading
 import time
 import uuid
 from typing import Any, Dict, List, Optional
 
+import orjson
+
 from .r2 import get_json, put_json
 
+# Hash of the last job blob this process read or wrote, per job_id. Lets save_job
+# skip the R2 PUT when nothing changed since then.
+_LAST_HASH: Dict[str, str] = {}
+_LAST_HASH_MAX = 10_000
+# Sync endpoints run on many threadpool threads; eviction must not interleave.
+_LAST_HASH_LOCK = threading.Lock()
+
 
 def now() -> float:
     return time.time()
 
 
+def new_job_id() -> str:
+    # UUIDv7 (RFC 9562): 48-bit unix-ms timestamp prefix + random bits, so ids (and the
+    # jobs/, videos/ keys built from them) sort by creation time. Old uuid4 ids stay valid.
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    rand_a, rand_b = rand >> 68, rand & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | rand_a << 64 | 0b10 << 62 | rand_b
+    return str(uuid.UUID(int=value))
+
+
 def job_key(job_id: str) -> str:
     return f"jobs/{job_id}.json"
 
 
 def results_key(job_id: str) -> str:
-    return f"results/{job_id}.json"
+    return f"results/{job_id}.json.zst"
 
 
 def video_key(job_id: str, filename: str) -> str:
@@ -26,7 +48,7 @@ def video_key(job_id: str, filename: str) -> str:
 
 
 def create_job(asset_types: List[str], filename_hint: Optional[str]) -> Dict[str, Any]:
-    job_id = str(uuid.uuid4())
+    job_id = new_job_id()
     job = {
         "job_id": job_id,
         "asset_types": asset_types,
@@ -40,12 +62,34 @@ def create_job(asset_types: List[str], filename_hint: Optional[str]) -> Dict[str
         "finished_at": None,
     }
     put_json(job_key(job_id), job)
+    _remember(job_id, _job_hash(job))
     return job
 
 
+def _job_hash(job: Dict[str, Any]) -> str:
+    return hashlib.blake2b(orjson.dumps(job, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def _remember(job_id: str, h: str) -> None:
+    with _LAST_HASH_LOCK:
+        _LAST_HASH.pop(job_id, None)
+        _LAST_HASH[job_id] = h
+        if len(_LAST_HASH) > _LAST_HASH_MAX:
+            _LAST_HASH.pop(next(iter(_LAST_HASH)), None)
+
+
 def get_job(job_id: str) -> Optional[Dict[str, Any]]:
-    return get_json(job_key(job_id))
+    job = get_json(job_key(job_id))
+    if job is not None:
+        _remember(job_id, _job_hash(job))
+    return job
 
 
 def save_job(job: Dict[str, Any]) -> None:
+    # Handlers always get_job() first, so an unchanged hash means the blob in R2
+    # already matches what we would write.
+    h = _job_hash(job)
+    if _LAST_HASH.get(job["job_id"]) == h:
+        return
     put_json(job_key(job["job_id"]), job)
+    _remember(job["job_id"], h)
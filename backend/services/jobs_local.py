@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "/storage")).resolve()
+STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+
+DB_PATH = STORAGE_DIR / "jobs.db"
+LEGACY_JOBS_PATH = STORAGE_DIR / "jobs.json"
+
+# Optional Redis wake-up queue: producers RPUSH job ids, workers BLPOP instead of sleep-polling.
+# Nothing in this tree queues local jobs yet (the API goes through R2 + RunPod), so until a
+# producer calls enqueue_job() the BLPOP simply times out like the plain sleep.
+REDIS_URL = os.getenv("REDIS_URL")
+QUEUE_KEY = os.getenv("REDIS_QUEUE_KEY", "jobs:queued")
+
+try:
+    import redis  # type: ignore
+except Exception as e:
+    redis = None
+    REDIS_IMPORT_ERROR = str(e)
+else:
+    REDIS_IMPORT_ERROR = None
+
+_REDIS = None
+
+# One connection per thread; sqlite3 connections must not be shared across threads.
+_LOCAL = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None:
+        return conn
+
+    # autocommit mode: every statement is its own transaction
+    conn = sqlite3.connect(str(DB_PATH), isolation_level=None, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            created_at REAL NOT NULL,
+            results_count INTEGER NOT NULL DEFAULT 0,
+            json TEXT NOT NULL
+        )
+        """
+    )
+    _migrate(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at DESC)")
+    _import_legacy_jobs(conn)
+    _LOCAL.conn = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # jobs.db files created before results_count existed
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+    if "results_count" not in cols:
+        conn.execute("ALTER TABLE jobs ADD COLUMN results_count INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "UPDATE jobs SET results_count = "
+            "COALESCE(json_extract(json, '$.results_count'), json_array_length(json, '$.results'), 0)"
+        )
+
+
+def _import_legacy_jobs(conn: sqlite3.Connection) -> None:
+    # One-time migration from the old single jobs.json blob.
+    if not LEGACY_JOBS_PATH.exists():
+        return
+    try:
+        jobs = orjson.loads(LEGACY_JOBS_PATH.read_bytes())
+    except Exception:
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for job_id, job in jobs.items():
+            job.setdefault("job_id", job_id)
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, status, created_at, results_count, json) VALUES (?, ?, ?, ?, ?)",
+                _row(job),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    LEGACY_JOBS_PATH.replace(LEGACY_JOBS_PATH.with_suffix(".json.migrated"))
+
+
+def _row(job: Dict[str, Any]) -> tuple:
+    created_at = job.get("created_at")
+    if created_at is None:
+        created_at = time.time()
+    results_count = job.get("results_count")
+    if results_count is None:
+        results_count = len(job.get("results") or [])
+    # stored as TEXT (not BLOB) so SQLite json_* functions treat it as JSON text
+    return (job["job_id"], job.get("status"), created_at, results_count, orjson.dumps(job).decode("utf-8"))
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    row = _connect().execute("SELECT json FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def save_job(job: Dict[str, Any], durable: bool = False) -> None:
+    """
+    Upsert a job row.
+
+    The connection runs with synchronous=NORMAL, so ordinary commits skip the
+    fsync (a crash can lose the last few, never corrupt the DB). Pass
+    durable=True for writes that must hit disk, e.g. terminal job states.
+    """
+    conn = _connect()
+    if durable:
+        conn.execute("PRAGMA synchronous=FULL")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, status, created_at, results_count, json) VALUES (?, ?, ?, ?, ?)",
+            _row(job),
+        )
+    finally:
+        if durable:
+            conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def list_jobs(
+    status: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    newest_first: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Dashboard listing: job summaries (no embedded results), newest first by default.
+
+    Filtering and ordering are served by the created_at / (status, created_at)
+    indexes and the summary is built in SQL, so only `limit` rows are touched
+    and no full job blob is deserialized in Python.
+
+    No endpoint serves it yet: the FastAPI app reads jobs from R2 (services/jobs.py),
+    not from this local DB.
+    """
+    # Built per call (not "?1 IS NULL OR ...") so SQLite can use the (status, created_at) index.
+    where = "WHERE status = ?" if status is not None else ""
+    order = "DESC" if newest_first else "ASC"
+    params = ((status,) if status is not None else ()) + (limit, offset)
+    rows = _connect().execute(
+        f"""
+        SELECT json_object(
+            'job_id', id,
+            'status', status,
+            'created_at', created_at,
+            'results_count', results_count,
+            'filename_hint', json_extract(json, '$.filename_hint'),
+            'error', json_extract(json, '$.error'),
+            'started_at', json_extract(json, '$.started_at'),
+            'finished_at', json_extract(json, '$.finished_at'),
+            'results_path', json_extract(json, '$.results_path')
+        )
+        FROM jobs {where} ORDER BY created_at {order} LIMIT ? OFFSET ?
+        """,
+        params,
+    ).fetchall()
+    return [orjson.loads(r[0]) for r in rows]
+
+
+def _redis():
+    global _REDIS
+    if _REDIS is None and REDIS_URL:
+        if redis is None:
+            raise RuntimeError(f"REDIS_URL is set but redis is not available. Import error: {REDIS_IMPORT_ERROR}")
+        _REDIS = redis.Redis.from_url(REDIS_URL)
+    return _REDIS
+
+
+def enqueue_job(job: Dict[str, Any]) -> None:
+    # The producer side for the local worker: whatever queues jobs in jobs.db must go
+    # through here so waiting workers are woken.
+    job["status"] = "queued"
+    job["error"] = None
+    save_job(job)
+
+    r = _redis()
+    if r is not None:
+        r.rpush(QUEUE_KEY, job["job_id"])
+
+
+def wait_for_job(timeout_seconds: float) -> None:
+    """
+    Block until a job may be available (or the timeout passes).
+
+    With Redis this wakes up ~1 RTT after enqueue_job; the popped id is only a
+    hint, the caller still claims through claim_next_job so the DB stays the
+    source of truth. Without Redis it just sleeps.
+    """
+    r = _redis()
+    if r is None:
+        time.sleep(timeout_seconds)
+        return
+    r.blpop([QUEUE_KEY], timeout=max(int(timeout_seconds), 1))
+
+
+def claim_next_job(started_at: float) -> Optional[Dict[str, Any]]:
+    """
+    Atomically move the oldest queued job to "processing" and return it.
+
+    A single UPDATE ... RETURNING, so concurrent workers (threads or processes)
+    never claim the same job and no application-level lock is needed.
+    """
+    row = _connect().execute(
+        """
+        UPDATE jobs
+        SET status = 'processing',
+            json = json_set(json, '$.status', 'processing', '$.started_at', ?, '$.error', NULL)
+        WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1)
+          AND status = 'queued'
+        RETURNING json
+        """,
+        (started_at,),
+    ).fetchone()
+    return orjson.loads(row[0]) if row else None
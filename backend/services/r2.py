@@ -1,11 +1,50 @@
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
+import orjson
+import zstandard
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from botocore.exceptions import ClientError
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO, List, Tuple
 
 
+# Stream uploads in 8 MB parts so memory stays bounded by chunk size, not object size.
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 << 20,
+    multipart_chunksize=8 << 20,
+    use_threads=True,
+)
+
+# Presigned GET URLs are reused until they get this close to expiry.
+PRESIGN_REUSE_MARGIN_SECONDS = 600
+# Insertion-ordered and capped, like jobs._LAST_HASH: oldest entries are dropped first.
+_PRESIGNED_GET_CACHE: Dict[Tuple[str, int], Tuple[str, float]] = {}
+_PRESIGNED_GET_CACHE_MAX = 10_000
+# Handler threads share the cache; lookup, insert and eviction happen under this lock.
+_PRESIGNED_GET_LOCK = threading.Lock()
+
+# API handler threads (same env var and default as main.py)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "100"))
+# R2 connections: at most 2 per handler thread at once (a results race runs two GETs
+# while its handler waits), so pool that many and don't re-handshake under load.
+R2_MAX_POOL_CONNECTIONS = int(os.getenv("R2_MAX_POOL_CONNECTIONS", str(2 * THREADPOOL_SIZE)))
+
+# Racing GETs for get_json_first. Every handler thread may race two keys at once, so size
+# the pool for all of them.
+_RACE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=2 * THREADPOOL_SIZE,
+    thread_name_prefix="r2-race",
+)
+
+
+@functools.lru_cache(maxsize=1)
 def get_s3_client():
+    # Building a client parses botocore's service models; do it once per process.
+    # boto3 clients are thread-safe, so the threadpool handlers can share it.
     endpoint = os.environ["R2_ENDPOINT"]
     access_key = os.environ["R2_ACCESS_KEY_ID"]
     secret_key = os.environ["R2_SECRET_ACCESS_KEY"]
@@ -17,10 +56,12 @@ def get_s3_client():
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key,
         region_name="auto",
-        config=Config(signature_version="s3v4"),
+        # shared by all threadpool handlers and race threads; see R2_MAX_POOL_CONNECTIONS
+        config=Config(signature_version="s3v4", max_pool_connections=R2_MAX_POOL_CONNECTIONS),
     )
 
 
+@functools.lru_cache(maxsize=1)
 def bucket_name() -> str:
     return os.environ["R2_BUCKET"]
 
@@ -35,35 +76,134 @@ def presign_put(key: str, content_type: str, expires_seconds: int = 3600) -> str
 
 
 def presign_get(key: str, expires_seconds: int = 3600) -> str:
+    # Object keys are immutable per job, so the same signed URL can be handed out
+    # (and cached by browsers) until it nears expiry.
+    now = time.time()
+    cache_key = (key, expires_seconds)
+    with _PRESIGNED_GET_LOCK:
+        cached = _PRESIGNED_GET_CACHE.get(cache_key)
+        if cached:
+            if now < cached[1] - PRESIGN_REUSE_MARGIN_SECONDS:
+                return cached[0]
+            _PRESIGNED_GET_CACHE.pop(cache_key, None)
+
+    # signing is local (no request), so it can run outside the lock
     s3 = get_s3_client()
-    return s3.generate_presigned_url(
+    url = s3.generate_presigned_url(
         ClientMethod="get_object",
         Params={"Bucket": bucket_name(), "Key": key},
         ExpiresIn=expires_seconds,
     )
+    with _PRESIGNED_GET_LOCK:
+        _PRESIGNED_GET_CACHE[cache_key] = (url, now + expires_seconds)
+        _evict_presigned(now)
+    return url
 
 
-def put_json(key: str, data: Dict[str, Any]) -> None:
-    import json
+def _evict_presigned(now: float) -> None:
+    # Drop the oldest entries while over the cap or already past the reuse margin.
+    # Caller holds _PRESIGNED_GET_LOCK.
+    while _PRESIGNED_GET_CACHE:
+        oldest = next(iter(_PRESIGNED_GET_CACHE))
+        entry = _PRESIGNED_GET_CACHE.get(oldest)
+        if (
+            entry is not None
+            and len(_PRESIGNED_GET_CACHE) <= _PRESIGNED_GET_CACHE_MAX
+            and now < entry[1] - PRESIGN_REUSE_MARGIN_SECONDS
+        ):
+            break
+        _PRESIGNED_GET_CACHE.pop(oldest, None)
 
+
+def upload_fileobj(key: str, fileobj: BinaryIO, content_type: str) -> None:
+    s3 = get_s3_client()
+    s3.upload_fileobj(
+        fileobj,
+        bucket_name(),
+        key,
+        ExtraArgs={"ContentType": content_type},
+        Config=UPLOAD_TRANSFER_CONFIG,
+    )
+
+
+def start_multipart_upload(key: str, content_type: str) -> str:
+    s3 = get_s3_client()
+    resp = s3.create_multipart_upload(Bucket=bucket_name(), Key=key, ContentType=content_type)
+    return resp["UploadId"]
+
+
+def upload_part(key: str, upload_id: str, part_number: int, body: bytes) -> Dict[str, Any]:
+    s3 = get_s3_client()
+    resp = s3.upload_part(
+        Bucket=bucket_name(),
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body,
+    )
+    return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+
+def complete_multipart_upload(key: str, upload_id: str, parts: List[Dict[str, Any]]) -> None:
+    s3 = get_s3_client()
+    s3.complete_multipart_upload(
+        Bucket=bucket_name(),
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": parts},
+    )
+
+
+def abort_multipart_upload(key: str, upload_id: str) -> None:
+    s3 = get_s3_client()
+    s3.abort_multipart_upload(Bucket=bucket_name(), Key=key, UploadId=upload_id)
+
+
+def put_json(key: str, data: Dict[str, Any]) -> None:
     s3 = get_s3_client()
     s3.put_object(
         Bucket=bucket_name(),
         Key=key,
-        Body=json.dumps(data).encode("utf-8"),
+        Body=orjson.dumps(data),
         ContentType="application/json",
     )
 
 
 def get_json(key: str) -> Optional[Dict[str, Any]]:
-    import json
-
     s3 = get_s3_client()
     try:
         obj = s3.get_object(Bucket=bucket_name(), Key=key)
-        return json.loads(obj["Body"].read().decode("utf-8"))
+        body = obj["Body"].read()
     except ClientError as e:
         code = e.response.get("Error", {}).get("Code")
         if code in ("NoSuchKey", "404"):
             return None
         raise
+
+    # results written by the RunPod worker are zstd-compressed (results/<id>.json.zst);
+    # decompressobj() also handles frames without a content size (multi-threaded compression)
+    if obj.get("ContentEncoding") == "zstd":
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return orjson.loads(body)
+
+
+def get_json_first(keys: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    GET keys that hold the same JSON concurrently and return the first one found.
+
+    Used for double-written objects, so one slow-to-appear copy doesn't add its
+    latency. Errors are only raised if no key produced a result.
+    """
+    futures = [_RACE_EXECUTOR.submit(get_json, k) for k in keys]
+    error: Optional[BaseException] = None
+    for f in as_completed(futures):
+        try:
+            data = f.result()
+        except Exception as e:
+            error = error or e
+            continue
+        if data is not None:
+            return data
+    if error is not None:
+        raise error
+    return None
@@ -1,16 +1,20 @@
 import os
 import time
-import json
+import hashlib
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from threading import Lock
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
-STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "/storage")).resolve()
-STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+import orjson
 
+from services.jobs_local import STORAGE_DIR, REDIS_URL, claim_next_job, save_job, wait_for_job
+
+# Max wait between claim attempts (BLPOP timeout with REDIS_URL, plain sleep otherwise)
 POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
-JOBS_PATH = STORAGE_DIR / "jobs.json"
-MEM_LOCK = Lock()
 
 # Extraction knobs
 SAMPLE_FPS = float(os.getenv("SAMPLE_FPS", "1.0"))          # frames per second to analyze
@@ -19,6 +23,27 @@ YOLO_MODEL = os.getenv("YOLO_MODEL", "yolov8n.pt")          # can be yolov8n.pt
 YOLO_CONF = float(os.getenv("YOLO_CONF", "0.25"))           # confidence threshold
 YOLO_IOU = float(os.getenv("YOLO_IOU", "0.45"))             # iou threshold for NMS
 YOLO_MAX_DET = int(os.getenv("YOLO_MAX_DET", "100"))        # max detections per frame
+YOLO_BATCH = max(int(os.getenv("YOLO_BATCH", "16")), 1)     # sampled frames per predict() call
+YOLO_HALF = os.getenv("YOLO_HALF", "1") == "1"              # FP16 inference (CUDA only)
+YOLO_DEVICE = os.getenv("YOLO_DEVICE", "")                  # e.g. "0" or "cpu"; empty = auto
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))            # model input size; frames are letterboxed to this
+LETTERBOX_COLOR = 114                                       # ultralytics' pad value
+
+# Optional compiled backend: export once, cache on disk, reuse across restarts
+YOLO_EXPORT = os.getenv("YOLO_EXPORT", "").lower()          # "engine" (TensorRT), "onnx", or empty = PyTorch
+YOLO_INT8 = os.getenv("YOLO_INT8", "0") == "1"              # INT8 export (needs YOLO_CALIB_DATA)
+YOLO_CALIB_DATA = os.getenv("YOLO_CALIB_DATA", "")          # dataset yaml used for INT8 calibration
+MODEL_CACHE_DIR = Path(os.getenv("MODEL_CACHE_DIR", "/models/cache"))
+
+RESULTS_WRITE_BUFFER = 1 << 20
+
+# Decoded frames buffered between the decode thread and the inference loop
+DECODE_QUEUE_SIZE = int(os.getenv("DECODE_QUEUE_SIZE", str(2 * YOLO_BATCH)))
+
+# Decoding: ffmpeg pipes only the sampled frames (falls back to OpenCV if ffmpeg is missing)
+FFMPEG_BIN = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+FFPROBE_BIN = shutil.which(os.getenv("FFPROBE_BIN", "ffprobe"))
+FFMPEG_HWACCEL = os.getenv("FFMPEG_HWACCEL", "")            # e.g. "cuda"; empty = software decode
 
 # OpenCV
 try:
@@ -29,6 +54,12 @@ except Exception as e:
 else:
     CV2_IMPORT_ERROR = None
 
+# NumPy (installed with OpenCV/ultralytics)
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None
+
 # YOLO
 try:
     from ultralytics import YOLO  # type: ignore
@@ -38,40 +69,57 @@ except Exception as e:
 else:
     YOLO_IMPORT_ERROR = None
 
+# Torch (installed with ultralytics); only used to detect CUDA and tune cudnn
+try:
+    import torch  # type: ignore
+except Exception:
+    torch = None
+
+# (scale, pad_x, pad_y, orig_w, orig_h): maps letterboxed boxes back to source pixels
+Letterbox = Tuple[float, int, int, int, int]
+
 # Global model cache so we load YOLO only once per worker process
 _MODEL = None
+# predict() kwargs resolved alongside the model (device / precision)
+_PREDICT_ARGS: Dict[str, Any] = {}
+# Input shape, resolved alongside the model: PyTorch weights run rect inference (pad only
+# to a multiple of the model stride, like ultralytics' LetterBox(auto=True)); exported
+# engines take the fixed YOLO_IMGSZ square they were built for.
+_RECT = False
+_STRIDE = 32
 
 
 def _now() -> float:
     return time.time()
 
 
-def _load_jobs() -> Dict[str, Any]:
-    if not JOBS_PATH.exists():
-        return {}
-    try:
-        return json.loads(JOBS_PATH.read_text())
-    except Exception:
-        return {}
-
-
-def _save_jobs(jobs: Dict[str, Any]) -> None:
-    tmp = STORAGE_DIR / "jobs.json.tmp"
-    tmp.write_text(json.dumps(jobs, indent=2))
-    tmp.replace(JOBS_PATH)
-
-
 def _job_dir(job_id: str) -> Path:
     d = STORAGE_DIR / job_id
     d.mkdir(parents=True, exist_ok=True)
     return d
 
 
-def _write_results(job_id: str, results: List[Dict[str, Any]]) -> str:
+def _write_results(job_id: str, batches: Iterable[List[Dict[str, Any]]]) -> Tuple[str, int]:
+    """
+    Stream detections to <job_dir>/results.ndjson (one JSON object per line) as
+    batches are produced, so memory stays bounded by one batch, not the whole video.
+
+    Returns (results_path, results_count).
+    """
     out_dir = _job_dir(job_id)
-    out_path = out_dir / "results.json"
-    out_path.write_text(json.dumps(results, indent=2))
-    return str(out_path)
+    out_path = out_dir / "results.ndjson"
+    tmp_path = out_dir / "results.ndjson.tmp"
+    count = 0
+    # Large write buffer, no per-batch syncs; fsync + atomic rename once at the end
+    # so readers only ever see a complete file.
+    with tmp_path.open("wb", buffering=RESULTS_WRITE_BUFFER) as f:
+        for dets in batches:
+            f.writelines(orjson.dumps(d, option=orjson.OPT_APPEND_NEWLINE) for d in dets)
+            count += len(dets)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
+    return str(out_path), count
 
 
 def _safe_float(x, default: float) -> float:
@@ -95,13 +143,125 @@ def _load_model():
     print(f"[worker] Loading YOLO model: {YOLO_MODEL}")
     # If YOLO_MODEL is like 'yolov8n.pt', ultralytics will download it if not present.
     # If your environment is offline, set YOLO_MODEL to a local path mounted into the container.
-    _MODEL = YOLO(YOLO_MODEL)
+    model = YOLO(YOLO_MODEL)
+
+    cuda = torch is not None and torch.cuda.is_available() and YOLO_DEVICE != "cpu"
+    device = YOLO_DEVICE or ("0" if cuda else "cpu")
+
+    exported = None
+    if YOLO_EXPORT:
+        try:
+            exported = _load_exported_model(model, device, cuda)
+        except Exception as e:
+            print(f"[worker] YOLO export failed, falling back to PyTorch: {e}")
+
+    global _RECT, _STRIDE
+    _RECT = exported is None
+    if _RECT:
+        try:
+            _STRIDE = int(max(model.model.stride))
+        except Exception:
+            _STRIDE = 32
+
+    if exported is not None:
+        model = exported
+    elif cuda:
+        # fixed input size, so let cudnn benchmark and keep the fastest kernels
+        torch.backends.cudnn.benchmark = True
+        model.to(f"cuda:{device}" if device.isdigit() else device)
+        model.fuse()
+
+    _PREDICT_ARGS.update(device=device, half=YOLO_HALF and cuda)
+    print(f"[worker] YOLO device={device} half={_PREDICT_ARGS['half']}")
+
+    _MODEL = model
     return _MODEL
 
 
-def _yolo_detect(frame_bgr, frame_index: int, timestamp_sec: float) -> List[Dict[str, Any]]:
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def _load_exported_model(model, device: str, cuda: bool):
+    """
+    Load (exporting on first use) a TensorRT/ONNX version of `model`.
+
+    The artifact is cached in MODEL_CACHE_DIR keyed by weights hash, imgsz,
+    precision and max batch, so only the first start on a host pays the compile.
+    Returns None when the requested backend can't run here.
+    """
+    if YOLO_EXPORT == "engine" and not cuda:
+        print("[worker] YOLO_EXPORT=engine needs CUDA; using PyTorch")
+        return None
+    if YOLO_INT8 and not YOLO_CALIB_DATA:
+        raise RuntimeError("YOLO_INT8=1 requires YOLO_CALIB_DATA")
+
+    weights = Path(getattr(model, "ckpt_path", None) or YOLO_MODEL)
+    precision = "int8" if YOLO_INT8 else ("fp16" if YOLO_HALF and cuda else "fp32")
+    suffix = ".engine" if YOLO_EXPORT == "engine" else f".{YOLO_EXPORT}"
+    cached = MODEL_CACHE_DIR / f"{weights.stem}_{_file_digest(weights)}_{YOLO_IMGSZ}_{precision}_b{YOLO_BATCH}{suffix}"
+
+    if not cached.exists():
+        print(f"[worker] Exporting YOLO to {YOLO_EXPORT} ({precision}); cached at {cached}")
+        MODEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        export_args: Dict[str, Any] = {}
+        if YOLO_INT8:
+            export_args.update(int8=True, data=YOLO_CALIB_DATA)
+        out = model.export(
+            format=YOLO_EXPORT,
+            imgsz=YOLO_IMGSZ,
+            half=precision == "fp16",
+            batch=YOLO_BATCH,
+            dynamic=True,  # last batch of a video is usually partial
+            device=device,
+            **export_args,
+        )
+        # export writes next to the weights; move into the cache atomically
+        tmp = cached.with_name(cached.name + ".tmp")
+        shutil.move(str(out), tmp)
+        os.replace(tmp, cached)
+
+    print(f"[worker] Loading exported YOLO model: {cached}")
+    return YOLO(str(cached), task="detect")
+
+
+def _letterbox_geometry(w: int, h: int, size: int) -> Tuple[int, int, int, int, Letterbox]:
+    """
+    Same math as ultralytics' LetterBox (centered, scale up or down).
+
+    Returns (resized_w, resized_h, out_w, out_h, letterbox). The output is the
+    size x size square for exported engines; for PyTorch weights (_RECT) it is
+    only padded up to a multiple of the stride, e.g. 640x384 for 1080p.
+    """
+    scale = min(size / w, size / h)
+    nw, nh = int(round(w * scale)), int(round(h * scale))
+    if _RECT:
+        out_w, out_h = -(-nw // _STRIDE) * _STRIDE, -(-nh // _STRIDE) * _STRIDE
+    else:
+        out_w = out_h = size
+    return nw, nh, out_w, out_h, (scale, (out_w - nw) // 2, (out_h - nh) // 2, w, h)
+
+
+def _letterbox(frame_bgr, size: int) -> Tuple[Any, Letterbox]:
+    h, w = frame_bgr.shape[:2]
+    nw, nh, out_w, out_h, lb = _letterbox_geometry(w, h, size)
+    if (nw, nh) != (w, h):
+        frame_bgr = cv2.resize(frame_bgr, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    _, px, py, _, _ = lb
+    frame_bgr = cv2.copyMakeBorder(
+        frame_bgr, py, out_h - nh - py, px, out_w - nw - px,
+        cv2.BORDER_CONSTANT, value=(LETTERBOX_COLOR,) * 3,
+    )
+    return frame_bgr, lb
+
+
+def _yolo_detect_batch(frames_bgr: List[Any], metas: List[Tuple[int, float, Letterbox]]) -> List[Dict[str, Any]]:
     """
-    Run YOLO on a single frame and return detections in a consistent schema:
+    Run YOLO on a batch of frames (one predict() call) and return detections in a consistent schema:
       {
         "asset_type": "<class_name>",
         "confidence": float,
@@ -111,25 +271,39 @@ def _yolo_detect(frame_bgr, frame_index: int, timestamp_sec: float) -> List[Dict
         "source": "yolo",
         "class_id": int
       }
+
+    metas[i] is (frame_index, timestamp_sec, letterbox) for frames_bgr[i]; frames are
+    already letterboxed (see _letterbox_geometry), and bboxes are mapped back to source pixels.
     """
+    if not frames_bgr:
+        return []
+
     model = _load_model()
 
     # Ultralytics can accept numpy arrays directly (BGR is fine); keep as-is for speed.
+    # A list source is run as a single N-image batch and yields one Results per image, in order.
+    # Inputs are already letterboxed to the shape ultralytics would pick, so its own
+    # letterbox is a no-op.
     results = model.predict(
-        source=frame_bgr,
+        source=frames_bgr,
+        imgsz=YOLO_IMGSZ,
         verbose=False,
         conf=YOLO_CONF,
         iou=YOLO_IOU,
         max_det=YOLO_MAX_DET,
+        **_PREDICT_ARGS,
     )
 
     dets: List[Dict[str, Any]] = []
-    if not results:
-        return dets
+    for r, (frame_index, timestamp_sec, lb) in zip(results or [], metas):
+        dets.extend(_result_to_dets(r, frame_index, timestamp_sec, lb))
+    return dets
 
-    r0 = results[0]
-    names = getattr(r0, "names", {}) or {}
-    boxes = getattr(r0, "boxes", None)
+
+def _result_to_dets(r, frame_index: int, timestamp_sec: float, lb: Letterbox) -> List[Dict[str, Any]]:
+    dets: List[Dict[str, Any]] = []
+    names = getattr(r, "names", {}) or {}
+    boxes = getattr(r, "boxes", None)
     if boxes is None:
         return dets
 
@@ -142,32 +316,180 @@ def _yolo_detect(frame_bgr, frame_index: int, timestamp_sec: float) -> List[Dict
         # Fallback if CPU conversion fails
         return dets
 
-    for i in range(len(xyxy)):
-        x1, y1, x2, y2 = xyxy[i].tolist()
-        c = float(conf[i])
-        class_id = int(cls[i])
-        class_name = names.get(class_id, str(class_id))
-
-        dets.append(
-            {
-                "asset_type": class_name,  # for Option 1, treat detected class as asset_type
-                "confidence": round(c, 4),
-                "frame": int(frame_index),
-                "timestamp_sec": round(float(timestamp_sec), 3),
-                "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                "source": "yolo",
-                "class_id": class_id,
-            }
-        )
+    # undo the letterbox: back to source-frame pixels
+    scale, px, py, w, h = lb
+    xyxy = (xyxy.astype(np.float32) - (px, py, px, py)) / scale
+    np.clip(xyxy, 0, (w, h, w, h), out=xyxy)
+
+    # Convert whole columns at once; per-row work is just the dict build.
+    bboxes = xyxy.astype(np.int32).tolist()  # truncates toward zero, same as int()
+    confs = np.round(conf.astype(np.float64), 4).tolist()
+    class_ids = cls.astype(np.int32).tolist()
+    frame_index = int(frame_index)
+    ts = round(float(timestamp_sec), 3)
+
+    return [
+        {
+            "asset_type": names.get(class_id, str(class_id)),  # for Option 1, treat detected class as asset_type
+            "confidence": c,
+            "frame": frame_index,
+            "timestamp_sec": ts,
+            "bbox": bbox,
+            "source": "yolo",
+            "class_id": class_id,
+        }
+        for bbox, c, class_id in zip(bboxes, confs, class_ids)
+    ]
+
+
+def _iter_frames_cv2(cap, every_n: int) -> Iterator[Tuple[int, Any, Letterbox]]:
+    # grab() demuxes/decodes without the BGR conversion + ndarray copy; only
+    # retrieve() (and letterbox) the frames we keep.
+    frame_idx = 0
+    try:
+        while cap.grab():
+            if frame_idx % every_n == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                yield (frame_idx, *_letterbox(frame, YOLO_IMGSZ))
+            frame_idx += 1
+    finally:
+        cap.release()
+
+
+def _probe_size(video_path: str) -> Tuple[int, int]:
+    # Display size: ffmpeg auto-rotates like OpenCV does, so a +-90 degree
+    # rotation (phone footage) swaps the coded width/height.
+    out = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+         "-of", "json", video_path],
+        capture_output=True, check=True,
+    ).stdout
+    stream = orjson.loads(out)["streams"][0]
+    w, h = int(stream["width"]), int(stream["height"])
+
+    rotation = stream.get("tags", {}).get("rotate", 0)
+    for sd in stream.get("side_data_list", []):
+        if "rotation" in sd:
+            rotation = sd["rotation"]
+    if int(float(rotation)) % 180:
+        w, h = h, w
+    return w, h
+
+
+def _iter_frames_ffmpeg(video_path: str, every_n: int) -> Iterator[Tuple[int, Any, Letterbox]]:
+    """
+    Yield (frame_index, letterboxed bgr ndarray, letterbox) for every every_n-th frame
+    using an ffmpeg pipe.
+
+    The select filter drops the other frames inside ffmpeg, so they are never
+    color-converted, copied through the pipe, or allocated in Python; kept frames
+    are scaled/padded to the model input shape inside ffmpeg, so only those pixels
+    cross the pipe. Frame indices and orientation (auto-rotated to display orientation) match
+    the OpenCV path (k-th output frame == input frame k*every_n).
+    """
+    w, h = _probe_size(video_path)
+    nw, nh, out_w, out_h, lb = _letterbox_geometry(w, h, YOLO_IMGSZ)
+    _, px, py, _, _ = lb
+    frame_bytes = out_w * out_h * 3
+    pad_color = "0x" + f"{LETTERBOX_COLOR:02x}" * 3
+
+    cmd = [FFMPEG_BIN, "-v", "error", "-nostdin"]
+    if FFMPEG_HWACCEL:
+        cmd += ["-hwaccel", FFMPEG_HWACCEL]
+    cmd += [
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-vf", f"select=not(mod(n\\,{every_n})),scale={nw}:{nh},pad={out_w}:{out_h}:{px}:{py}:color={pad_color}",
+        "-vsync", "0",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-",
+    ]
+
+    # stderr goes to a file, not a pipe: a corrupt video logs a line per bad frame, and
+    # a full, unread stderr pipe would block ffmpeg while we block on stdout
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+    k = 0
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield k * every_n, np.frombuffer(buf, dtype=np.uint8).reshape(out_h, out_w, 3), lb
+            k += 1
+
+        if proc.wait() != 0 and k == 0:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg failed to decode {video_path}: {stderr.read().decode(errors='replace')}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        stderr.close()
 
-    return dets
 
+_PREFETCH_DONE = object()
 
-def _extract_from_video(video_path: str) -> List[Dict[str, Any]]:
+
+class _PrefetchError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _prefetch(items: Iterator[Any], maxsize: int) -> Iterator[Any]:
+    """
+    Drive `items` from a background thread and yield its values through a bounded queue.
+
+    Decode (CPU) then overlaps with inference (GPU) in the caller. Errors are
+    re-raised in the caller; closing this generator stops the thread and closes
+    `items` (e.g. kills the ffmpeg process) from the thread that owns it.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(maxsize, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except BaseException as e:
+            put(_PrefetchError(e))
+        finally:
+            items.close()
+            put(_PREFETCH_DONE)
+
+    t = threading.Thread(target=produce, name="frame-decoder", daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _PREFETCH_DONE:
+                return
+            if isinstance(item, _PrefetchError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        t.join()
+
+
+def _extract_from_video(video_path: str) -> Iterator[List[Dict[str, Any]]]:
     """
     Frame sampling + YOLO inference.
 
-    Returns a flat list of detections across sampled frames.
+    Yields detections one YOLO batch at a time, in frame order.
     """
     if cv2 is None:
         raise RuntimeError(
@@ -175,6 +497,9 @@ def _extract_from_video(video_path: str) -> List[Dict[str, Any]]:
             f"Import error: {CV2_IMPORT_ERROR}"
         )
 
+    # resolves the input shape (_RECT/_STRIDE) before frames are letterboxed
+    _load_model()
+
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise RuntimeError(f"Failed to open video with OpenCV: {video_path}")
@@ -185,29 +510,36 @@ def _extract_from_video(video_path: str) -> List[Dict[str, Any]]:
 
     sample_every_n_frames = max(int(round(fps / max(SAMPLE_FPS, 0.1))), 1)
 
-    detections: List[Dict[str, Any]] = []
-    frame_idx = -1
-    sampled = 0
-
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
+    if FFMPEG_BIN and FFPROBE_BIN and np is not None:
+        cap.release()
+        frames = _iter_frames_ffmpeg(video_path, sample_every_n_frames)
+    else:
+        frames = _iter_frames_cv2(cap, sample_every_n_frames)
 
-        frame_idx += 1
+    # decode + letterbox run in their own thread while this one runs YOLO
+    frames = _prefetch(frames, DECODE_QUEUE_SIZE)
 
-        if frame_idx % sample_every_n_frames != 0:
-            continue
+    batch: List[Any] = []
+    metas: List[Tuple[int, float, Letterbox]] = []
+    sampled = 0
 
-        timestamp_sec = frame_idx / fps
-        detections.extend(_yolo_detect(frame, frame_idx, timestamp_sec))
+    try:
+        for frame_idx, frame, lb in frames:
+            batch.append(frame)
+            metas.append((frame_idx, frame_idx / fps, lb))
+            if len(batch) >= YOLO_BATCH:
+                yield _yolo_detect_batch(batch, metas)
+                batch, metas = [], []
 
-        sampled += 1
-        if sampled >= MAX_SAMPLED_FRAMES:
-            break
+            sampled += 1
+            if sampled >= MAX_SAMPLED_FRAMES:
+                break
+    finally:
+        # stops the ffmpeg process / releases the capture
+        frames.close()
 
-    cap.release()
-    return detections
+    # flush the last partial batch
+    yield _yolo_detect_batch(batch, metas)
 
 
 def process_job(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
@@ -224,12 +556,10 @@ def process_job(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
     job["error"] = None
 
     try:
-        results = _extract_from_video(video_path)
-
-        results_path = _write_results(job_id, results)
+        results_path, results_count = _write_results(job_id, _extract_from_video(video_path))
         job["status"] = "done"
-        job["results"] = results
         job["results_path"] = results_path
+        job["results_count"] = results_count
         job["finished_at"] = _now()
         return job
 
@@ -241,27 +571,29 @@ def process_job(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def main():
-    print(f"[worker] Starting. STORAGE_DIR={STORAGE_DIR} POLL_SECONDS={POLL_SECONDS}")
+    print(f"[worker] Starting. STORAGE_DIR={STORAGE_DIR} POLL_SECONDS={POLL_SECONDS} REDIS={'on' if REDIS_URL else 'off'}")
     print(f"[worker] Extraction config: SAMPLE_FPS={SAMPLE_FPS} MAX_FRAMES={MAX_SAMPLED_FRAMES}")
-    print(f"[worker] YOLO config: YOLO_MODEL={YOLO_MODEL} YOLO_CONF={YOLO_CONF} YOLO_IOU={YOLO_IOU} YOLO_MAX_DET={YOLO_MAX_DET}")
+    print(f"[worker] YOLO config: YOLO_MODEL={YOLO_MODEL} YOLO_EXPORT={YOLO_EXPORT or 'off'} YOLO_CONF={YOLO_CONF} YOLO_IOU={YOLO_IOU} YOLO_MAX_DET={YOLO_MAX_DET} YOLO_BATCH={YOLO_BATCH}")
 
     while True:
         try:
-            with MEM_LOCK:
-                jobs = _load_jobs()
-                queued = [(jid, j) for jid, j in jobs.items() if j.get("status") == "queued"]
+            # atomically claims the oldest queued job, so several workers can run side by side
+            job = claim_next_job(_now())
 
-                if queued:
-                    job_id, job = queued[0]
-                    print(f"[worker] Processing job {job_id}")
+            if job:
+                job_id = job["job_id"]
+                print(f"[worker] Processing job {job_id}")
 
-                    jobs[job_id] = process_job(job_id, job)
-                    _save_jobs(jobs)
+                # terminal state: the one write per job that must survive a crash
+                save_job(process_job(job_id, job), durable=True)
+                # drain the backlog without waiting between jobs
+                continue
+
+            wait_for_job(POLL_SECONDS)
 
         except Exception as e:
             print(f"[worker] ERROR: {e}")
-
-        time.sleep(POLL_SECONDS)
+            time.sleep(POLL_SECONDS)
 
 
 if __name__ == "__main__":
@@ -155,7 +155,8 @@ export default function App() {
       const status = job?.status || "unknown";
 
       if (status === "done") {
-        const resultsCount = Array.isArray(job?.results) ? job.results.length : 0;
+        const resultsCount =
+          job?.results_count ?? (Array.isArray(job?.results) ? job.results.length : 0);
         setJob(k, {
           status: "Done",
           message: `Status: done | Results: ${resultsCount}${job?.results_path ? ` | ${job.results_path}` : ""}`,
@@ -214,13 +215,15 @@ export default function App() {
       // --- Upload video ---
       setJob(k, { status: "Uploading…", jobId, message: "" });
 
-      const form = new FormData();
-      form.append("file", file);
-
-      const upRes = await fetch(`${API_BASE}/jobs/${jobId}/upload`, {
-        method: "POST",
-        body: form,
-      });
+      // Raw PUT of the file body: the backend streams it to storage without multipart parsing
+      const upRes = await fetch(
+        `${API_BASE}/jobs/${jobId}/upload-raw?filename=${encodeURIComponent(file.name)}`,
+        {
+          method: "PUT",
+          headers: { "Content-Type": file.type || "application/octet-stream" },
+          body: file,
+        }
+      );
 
       if (!upRes.ok) {
         const err = await readError(upRes);
@@ -0,0 +1,70 @@
+"""
+Build a small INT8 calibration dataset for the TensorRT export in handler.py.
+
+Samples frames evenly from representative road videos into <out>/images/ and
+writes <out>/calib.yaml. Point YOLO_CALIB_DATA at that yaml and set
+YOLO_EXPORT=engine YOLO_INT8=1 to get an INT8 engine on first start.
+
+  python calibrate.py --out /runpod-volume/calib --frames 200 a.mp4 b.mp4
+"""
+import argparse
+import os
+from typing import List
+
+import cv2
+from ultralytics import YOLO
+
+
+def sample_frames(video_paths: List[str], out_dir: str, total: int) -> int:
+    images_dir = os.path.join(out_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+
+    per_video = max(total // max(len(video_paths), 1), 1)
+    written = 0
+    for vi, path in enumerate(video_paths):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"[calibrate] skipping unreadable video: {path}")
+            continue
+
+        n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or per_video
+        step = max(n_frames // per_video, 1)
+        for i in range(per_video):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, i * step)
+            ok, frame = cap.read()
+            if not ok:
+                break
+            cv2.imwrite(os.path.join(images_dir, f"v{vi:03d}_{i:04d}.jpg"), frame)
+            written += 1
+        cap.release()
+    return written
+
+
+def write_yaml(out_dir: str, names: dict) -> str:
+    # Ultralytics wants a dataset yaml; calibration only reads the images.
+    yaml_path = os.path.join(out_dir, "calib.yaml")
+    with open(yaml_path, "w") as f:
+        f.write(f"path: {os.path.abspath(out_dir)}\n")
+        f.write("train: images\n")
+        f.write("val: images\n")
+        f.write("names:\n")
+        for k in sorted(names):
+            f.write(f"  {k}: {names[k]}\n")
+    return yaml_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("videos", nargs="+", help="representative input videos")
+    parser.add_argument("--out", required=True, help="output dataset directory")
+    parser.add_argument("--frames", type=int, default=200, help="total frames to sample")
+    parser.add_argument("--model", default=os.environ.get("YOLO_MODEL", "yolov8n.pt"), help="weights (for class names)")
+    args = parser.parse_args()
+
+    written = sample_frames(args.videos, args.out, args.frames)
+    yaml_path = write_yaml(args.out, YOLO(args.model).names)
+    print(f"[calibrate] wrote {written} frames; YOLO_CALIB_DATA={yaml_path}")
+
+
+if __name__ == "__main__":
+    main()
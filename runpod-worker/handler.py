@@ -1,13 +1,23 @@
+import hashlib
+import io
 import os
-import json
+import shutil
+import subprocess
 import tempfile
-from typing import Any, Dict, Optional, List
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, List, Tuple
 
 import runpod
 import boto3
+import cv2
+import orjson
+import torch
+import zstandard
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from ultralytics import YOLO
-import cv2
+import numpy as np
 
 
 def require_env(name: str) -> str:
@@ -29,6 +39,82 @@ FRAME_STRIDE = int(os.environ.get("FRAME_STRIDE", "10"))
 YOLO_CONF = float(os.environ.get("YOLO_CONF", "0.25"))
 YOLO_IOU = float(os.environ.get("YOLO_IOU", "0.45"))
 YOLO_MAX_DET = int(os.environ.get("YOLO_MAX_DET", "300"))
+BATCH_SIZE = max(int(os.environ.get("YOLO_BATCH", "16")), 1)
+YOLO_IMGSZ = int(os.environ.get("YOLO_IMGSZ", "640"))
+# Shared by warm_up() and detect_batch(): Ultralytics builds its predictor (AutoBackend,
+# incl. FP16 weights) on the first predict() call and reuses it, so the warm-up call
+# must already carry `half`.
+PREDICT_ARGS: Dict[str, Any] = {
+    "imgsz": YOLO_IMGSZ,
+    "half": torch.cuda.is_available(),
+    "conf": YOLO_CONF,
+    "iou": YOLO_IOU,
+    "max_det": YOLO_MAX_DET,
+    "verbose": False,
+}
+# ffmpeg -hwaccel for decoding, e.g. "cuda" (NVDEC). Empty: software decode.
+FFMPEG_HWACCEL = os.environ.get("FFMPEG_HWACCEL", "")
+# Without ffmpeg/ffprobe on PATH, decoding falls back to OpenCV (CV2Frames).
+HAVE_FFMPEG = bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+# Near-duplicate skip: a sampled frame whose mean abs pixel difference (on a subsample of
+# the picture, padding excluded) from the last inferred frame is below this reuses that frame's
+# detections instead of running YOLO. 0 disables it.
+DIFF_THRESHOLD = float(os.environ.get("DIFF_THRESHOLD", "0"))
+
+# Optional compiled backend, same knobs as backend/worker.py. YOLO_EXPORT="engine"
+# (TensorRT) exports YOLO_MODEL on first use (needs the GPU, so it can't happen at image
+# build time) into MODEL_CACHE_DIR, keyed by weights hash, imgsz, precision and batch;
+# point MODEL_CACHE_DIR at a network volume to share it across workers. Empty, or no
+# CUDA: plain PyTorch weights.
+YOLO_EXPORT = os.environ.get("YOLO_EXPORT", "").lower()
+# INT8 instead of FP16; needs a calibration dataset yaml (see calibrate.py)
+YOLO_INT8 = os.environ.get("YOLO_INT8", "0") == "1"
+YOLO_CALIB_DATA = os.environ.get("YOLO_CALIB_DATA", "")
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR", "/models/cache")
+
+# Video download: concurrent ranged GETs instead of one sequential stream
+DOWNLOAD_CONCURRENCY = int(os.environ.get("DOWNLOAD_CONCURRENCY", "16"))
+DOWNLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=DOWNLOAD_CONCURRENCY,
+    use_threads=True,
+)
+
+# "json" (default): nested frames/detections JSON at results/<id>.json.
+# "parquet": column-wise detections at results/<id>.parquet plus a small JSON manifest
+# at results/<id>.json pointing to it.
+RESULTS_FORMAT = os.environ.get("RESULTS_FORMAT", "json").lower()
+
+# Results JSON is zstd-compressed (level 3, all cores) before upload; the repeated
+# keys and similar floats typically shrink 5-10x.
+_ZSTD = zstandard.ZstdCompressor(level=3, threads=-1)
+
+# Results upload: multipart with parallel parts once the JSON gets big
+RESULTS_UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+# RunPod reuses warm workers across jobs: keep the model and S3 client per process.
+_MODEL: Optional[YOLO] = None
+_MODEL_WARM = False
+_S3 = None
+# Two pinned uint8 NCHW staging buffers and a copy stream for the GPU input path
+# (allocated on the first CUDA batch), so one batch can upload while the other runs.
+_PINNED: List[torch.Tensor] = []
+_H2D_STREAM = None
+# Decode ring: two (BATCH_SIZE, out_h, out_w, 3) uint8 slabs (see Letterbox) that ffmpeg reads into,
+# one filling while the other's batch is in flight.
+_RING: Optional[np.ndarray] = None
+
+# Background I/O (e.g. the video download, the final parallel PUTs) so it overlaps
+# with model work / itself.
+_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="io")
+# Inference runs here so the handler thread can decode/stage the next batch meanwhile.
+_GPU = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
 
 
 def s3_client():
@@ -38,8 +124,295 @@ def s3_client():
         aws_access_key_id=R2_ACCESS_KEY_ID,
         aws_secret_access_key=R2_SECRET_ACCESS_KEY,
         region_name="auto",
-        config=Config(signature_version="s3v4"),
+        # enough pooled connections for the parallel ranged download
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=max(DOWNLOAD_CONCURRENCY * 2, 10),
+            tcp_keepalive=True,
+            # R2 throttles with 429/503 under bursty parallel part traffic
+            retries={"max_attempts": 5, "mode": "adaptive"},
+        ),
+    )
+
+
+def get_s3():
+    global _S3
+    if _S3 is None:
+        _S3 = s3_client()
+    return _S3
+
+
+def get_model() -> YOLO:
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = load_model()
+    return _MODEL
+
+
+def warm_up(model: YOLO) -> None:
+    # First predict() initializes CUDA kernels / the TensorRT context; do it once per
+    # process, while the video is still downloading.
+    global _MODEL_WARM
+    if _MODEL_WARM:
+        return
+    model.predict(
+        source=np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), dtype=np.uint8),
+        **PREDICT_ARGS,
     )
+    _MODEL_WARM = True
+
+
+def use_export() -> bool:
+    return bool(YOLO_EXPORT) and torch.cuda.is_available()
+
+
+def export_precision() -> str:
+    return "int8" if YOLO_INT8 else "fp16"
+
+
+def model_stride(model: YOLO) -> Optional[int]:
+    # PyTorch weights accept any stride-aligned shape (rect inference); exports are fixed-size
+    if use_export():
+        return None
+    try:
+        return int(max(model.model.stride))
+    except Exception:
+        return 32
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def load_model() -> YOLO:
+    if not use_export():
+        return YOLO(MODEL_NAME)
+
+    precision = export_precision()
+    if YOLO_INT8 and not YOLO_CALIB_DATA:
+        raise RuntimeError("YOLO_INT8=1 requires YOLO_CALIB_DATA (see calibrate.py)")
+
+    # Keyed like backend/worker.py's cache, so changing the weights, imgsz, precision or
+    # batch exports a new engine instead of silently reusing a stale one.
+    base = YOLO(MODEL_NAME)  # downloads the weights if needed
+    weights = str(getattr(base, "ckpt_path", None) or MODEL_NAME)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    suffix = ".engine" if YOLO_EXPORT == "engine" else f".{YOLO_EXPORT}"
+    cached = os.path.join(
+        MODEL_CACHE_DIR, f"{stem}_{file_digest(weights)}_{YOLO_IMGSZ}_{precision}_b{BATCH_SIZE}{suffix}"
+    )
+
+    if not os.path.exists(cached):
+        print(f"[handler] Exporting {MODEL_NAME} to {YOLO_EXPORT} ({precision}); cached at {cached}")
+        calib = {"int8": True, "data": YOLO_CALIB_DATA} if YOLO_INT8 else {}
+        exported = base.export(
+            format=YOLO_EXPORT,
+            imgsz=YOLO_IMGSZ,
+            half=not YOLO_INT8,
+            dynamic=True,  # the last batch of a video is usually partial
+            batch=BATCH_SIZE,
+            **calib,
+        )
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        # per-process tmp name: several workers may export onto the same network volume
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        shutil.move(str(exported), tmp)
+        os.replace(tmp, cached)
+
+    # predict() calls stay the same; Ultralytics dispatches to TensorRT
+    return YOLO(cached, task="detect")
+
+
+def probe_size(video_path: str) -> Tuple[int, int]:
+    # Display size: ffmpeg auto-rotates (like the OpenCV path), so a +-90 degree
+    # rotation (phone footage) swaps the coded width/height.
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+         "-of", "json", video_path],
+        capture_output=True, check=True,
+    ).stdout
+    stream = orjson.loads(out)["streams"][0]
+    w, h = int(stream["width"]), int(stream["height"])
+
+    rotation = stream.get("tags", {}).get("rotate", 0)
+    for sd in stream.get("side_data_list", []):
+        if "rotation" in sd:
+            rotation = sd["rotation"]
+    if int(float(rotation)) % 180:
+        w, h = h, w
+    return w, h
+
+
+def video_size(video_path: str) -> Tuple[int, int]:
+    if HAVE_FFMPEG:
+        return probe_size(video_path)
+    cap = open_capture(video_path)
+    try:
+        # size of an actual (auto-rotated) frame; CAP_PROP_FRAME_* may report the coded size
+        ok, frame = cap.read()
+        if not ok:
+            raise RuntimeError("OpenCV could not decode a frame")
+        return frame.shape[1], frame.shape[0]
+    finally:
+        cap.release()
+
+
+def open_capture(video_path: str):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("OpenCV could not open the video")
+    return cap
+
+
+class Letterbox:
+    """
+    Centered resize+pad of a w x h frame into the model input (same math as Ultralytics).
+
+    With `stride` (PyTorch weights) the output is only padded up to a multiple of
+    it, like Ultralytics' rect LetterBox(auto=True), e.g. 640x384 for 1080p;
+    without it (TensorRT engines, fixed shape) it is the full size x size square.
+    """
+
+    PAD_VALUE = 114  # 0x727272 in ffmpeg_filter()
+
+    def __init__(self, w: int, h: int, size: int, stride: Optional[int] = None) -> None:
+        self.w, self.h = w, h
+        self.scale = min(size / w, size / h)
+        self.nw, self.nh = int(round(w * self.scale)), int(round(h * self.scale))
+        if stride:
+            self.out_w, self.out_h = -(-self.nw // stride) * stride, -(-self.nh // stride) * stride
+        else:
+            self.out_w = self.out_h = size
+        self.pad_x, self.pad_y = (self.out_w - self.nw) // 2, (self.out_h - self.nh) // 2
+
+    def ffmpeg_filter(self) -> str:
+        return (
+            f"scale={self.nw}:{self.nh},"
+            f"pad={self.out_w}:{self.out_h}:{self.pad_x}:{self.pad_y}:color=0x727272"
+        )
+
+    def unmap(self, xyxy: np.ndarray) -> np.ndarray:
+        # model-input coords -> source-frame pixels
+        out = (xyxy.astype(np.float32) - np.array([self.pad_x, self.pad_y] * 2, np.float32)) / np.float32(self.scale)
+        np.clip(out, 0, np.array([self.w, self.h] * 2, np.float32), out=out)
+        return out
+
+
+class FFmpegFrames:
+    """
+    Every stride-th frame of a video, decoded by an ffmpeg pipe straight into caller buffers.
+
+    The select filter drops the other frames inside ffmpeg, so they never get
+    color-converted, piped, or turned into arrays; kept frames are letterboxed to
+    the model input shape inside ffmpeg, so only those pixels cross the pipe.
+    readinto() fills a preallocated array, so no per-frame buffer is allocated.
+    frame_idx matches the old cap.read() counting (k-th output frame == input frame k*stride).
+    """
+
+    def __init__(self, video_path: str, stride: int, lb: Letterbox) -> None:
+        self.stride = stride
+        self.k = 0
+        # no -noautorotate: boxes stay in display orientation, as with cv2.VideoCapture
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if FFMPEG_HWACCEL:
+            # decoded surfaces are downloaded to system memory for the select/scale/pad
+            # filters, so only model-input-sized frames still cross the pipe
+            cmd += ["-hwaccel", FFMPEG_HWACCEL]
+        cmd += [
+            "-i", video_path,
+            "-map", "0:v:0",
+            "-vf", f"select=not(mod(n\\,{stride})),{lb.ffmpeg_filter()}",
+            "-vsync", "0",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-",
+        ]
+        # stderr goes to a file, not a pipe: a corrupt video logs a line per bad frame, and
+        # a full, unread stderr pipe would block ffmpeg while we block on stdout
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=self.stderr)
+
+    def __enter__(self) -> "FFmpegFrames":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.stderr.close()
+
+    def readinto(self, out: np.ndarray) -> Optional[int]:
+        """Fill `out` (contiguous out_h x out_w x 3 uint8) with the next frame; return its frame_idx, or None at the end."""
+        view = memoryview(out).cast("B")
+        got = 0
+        while got < len(view):
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                break
+            got += n
+
+        if got < len(view):
+            if self.proc.wait() != 0 and self.k == 0:
+                self.stderr.seek(0)
+                raise RuntimeError(f"ffmpeg could not decode the video: {self.stderr.read().decode(errors='replace')}")
+            return None
+
+        frame_idx = self.k * self.stride
+        self.k += 1
+        return frame_idx
+
+
+class CV2Frames:
+    """
+    OpenCV fallback with the FFmpegFrames interface, for images without ffmpeg.
+
+    cap.grab() steps over skipped frames without converting them to BGR or
+    allocating arrays; only kept frames are retrieve()d, into a reused buffer,
+    and letterboxed into the caller's array.
+    """
+
+    def __init__(self, video_path: str, stride: int, lb: Letterbox) -> None:
+        self.stride, self.lb = stride, lb
+        self.n = 0
+        self.cap = open_capture(video_path)
+        self._src = None
+        self._resized = np.empty((lb.nh, lb.nw, 3), dtype=np.uint8)
+
+    def __enter__(self) -> "CV2Frames":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cap.release()
+
+    def readinto(self, out: np.ndarray) -> Optional[int]:
+        lb = self.lb
+        while self.cap.grab():
+            frame_idx = self.n
+            self.n += 1
+            if frame_idx % self.stride:
+                continue
+
+            ok, self._src = self.cap.retrieve(self._src)
+            if not ok:
+                return None
+            cv2.resize(self._src, (lb.nw, lb.nh), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+            x0, y0 = lb.pad_x, lb.pad_y
+            x1, y1 = x0 + lb.nw, y0 + lb.nh
+            out[:y0] = lb.PAD_VALUE
+            out[y1:] = lb.PAD_VALUE
+            out[y0:y1, :x0] = lb.PAD_VALUE
+            out[y0:y1, x1:] = lb.PAD_VALUE
+            out[y0:y1, x0:x1] = self._resized
+            return frame_idx
+        return None
+
+
+def open_frames(video_path: str, stride: int, lb: Letterbox):
+    return FFmpegFrames(video_path, stride, lb) if HAVE_FFMPEG else CV2Frames(video_path, stride, lb)
 
 
 def job_key(job_id: str) -> str:
@@ -47,32 +420,298 @@ def job_key(job_id: str) -> str:
 
 
 def results_key(job_id: str) -> str:
-    return f"results/{job_id}.json"
+    return f"results/{job_id}.json.zst"
+
+
+def results_key_alt(job_id: str) -> str:
+    # same body as results_key; readers race both GETs to ride out slow visibility
+    return f"results/{job_id}.alt.json.zst"
+
+
+def detections_key(job_id: str) -> str:
+    return f"results/{job_id}.parquet"
 
 
 def load_job(s3, job_id: str) -> Dict[str, Any]:
     obj = s3.get_object(Bucket=R2_BUCKET, Key=job_key(job_id))
-    return json.loads(obj["Body"].read().decode("utf-8"))
+    return orjson.loads(obj["Body"].read())
 
 
 def save_job(s3, job: Dict[str, Any]) -> None:
     s3.put_object(
         Bucket=R2_BUCKET,
         Key=job_key(job["job_id"]),
-        Body=json.dumps(job).encode("utf-8"),
+        Body=orjson.dumps(job),
         ContentType="application/json",
     )
 
 
-def write_results(s3, job_id: str, data: Dict[str, Any]) -> None:
-    s3.put_object(
-        Bucket=R2_BUCKET,
-        Key=results_key(job_id),
-        Body=json.dumps(data).encode("utf-8"),
-        ContentType="application/json",
+def encode_results(data: Dict[str, Any]) -> bytes:
+    return _ZSTD.compress(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def write_results(s3, key: str, body: bytes) -> None:
+    # single PUT below the threshold, parallel multipart above it
+    s3.upload_fileobj(
+        io.BytesIO(body),
+        R2_BUCKET,
+        key,
+        ExtraArgs={"ContentType": "application/json", "ContentEncoding": "zstd"},
+        Config=RESULTS_UPLOAD_CONFIG,
     )
 
 
+class Detections:
+    """
+    Column-wise (SoA) accumulator for YOLO output.
+
+    frame_ids/counts get one entry per sampled frame; rows gets one float32
+    (n, 6) [x1, y1, x2, y2, conf, cls] view per frame with boxes, packed once at
+    the end, so no per-box Python objects exist until (and unless) the JSON
+    layout is built.
+    """
+
+    FIELDS = ("frame", "class", "conf", "x1", "y1", "x2", "y2")
+
+    def __init__(self) -> None:
+        self.frame_ids: List[int] = []
+        self.counts: List[int] = []
+        self._rows: List[np.ndarray] = []
+
+    def add(self, frame_idx: int, rows: np.ndarray) -> None:
+        self.frame_ids.append(frame_idx)
+        self.counts.append(len(rows))
+        if len(rows):
+            self._rows.append(rows)
+
+    def repeat(self, frame_idx: int) -> None:
+        # frame_idx gets the same boxes as the last added frame (rows are never mutated)
+        self.frame_ids.append(frame_idx)
+        self.counts.append(self.counts[-1])
+        if self.counts[-1]:
+            self._rows.append(self._rows[-1])
+
+    def pack(self) -> np.ndarray:
+        """
+        All detections as one contiguous float32 (7, n) block, one row per FIELDS
+        entry, so every column is a contiguous slice.
+        """
+        n = sum(self.counts)
+        out = np.empty((len(self.FIELDS), n), np.float32)
+        out[0] = np.repeat(np.asarray(self.frame_ids, dtype=np.float32), self.counts)
+        if n:
+            rows = np.concatenate(self._rows)
+            out[1] = rows[:, 5]
+            out[2] = rows[:, 4]
+            out[3:] = rows[:, :4].T
+        return out
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        # one row per detection; float columns are views into pack()
+        packed = self.pack()
+        cols = dict(zip(self.FIELDS, packed))
+        cols["frame"] = cols["frame"].astype(np.int64)
+        cols["class"] = cols["class"].astype(np.int32)
+        return cols
+
+    def to_frames(self) -> List[Dict[str, Any]]:
+        # The nested JSON contract: [{"frame", "detections": [{"class", "conf", "xyxy"}]}]
+        cols = self.columns()
+        cls = cols["class"].tolist()
+        conf = cols["conf"].tolist()
+        xyxy = np.stack([cols["x1"], cols["y1"], cols["x2"], cols["y2"]], axis=1).tolist()
+
+        frames: List[Dict[str, Any]] = []
+        i = 0
+        for frame_idx, n in zip(self.frame_ids, self.counts):
+            frames.append({
+                "frame": frame_idx,
+                "detections": [{"class": cls[j], "conf": conf[j], "xyxy": xyxy[j]} for j in range(i, i + n)],
+            })
+            i += n
+        return frames
+
+
+def write_detections_parquet(s3, job_id: str, dets: Detections) -> str:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buf = pa.BufferOutputStream()
+    pq.write_table(pa.table(dets.columns()), buf, compression="zstd")
+    key = detections_key(job_id)
+    s3.upload_fileobj(
+        pa.BufferReader(buf.getvalue()),
+        R2_BUCKET,
+        key,
+        ExtraArgs={"ContentType": "application/vnd.apache.parquet"},
+        Config=RESULTS_UPLOAD_CONFIG,
+    )
+    return key
+
+
+def input_dtype(model) -> torch.dtype:
+    # what the backend Ultralytics built on warm-up consumes: FP16 for half .pt weights
+    # and FP16 engines, FP32 otherwise (e.g. INT8 engines take FP32 input)
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    return torch.float16 if getattr(backend, "fp16", False) else torch.float32
+
+
+def stage_batch(frames: np.ndarray, slot: int, dtype: torch.dtype):
+    """
+    Model input for one batch.
+
+    On CUDA: a single normalized NCHW RGB tensor of `dtype` on the device. The
+    channel flip / transpose is one NumPy pass straight into uint8 pinned buffer
+    `slot` (two, used alternately); the uint8 batch is copied to the device on a
+    side stream and cast + scaled there, like Ultralytics' own preprocess, so H2D
+    carries one byte per channel. Returns (tensor, ready event). Frames come
+    letterboxed already, so no resize is needed. On CPU: the plain BGR uint8 list.
+    """
+    if not torch.cuda.is_available():
+        return list(frames)
+
+    global _H2D_STREAM
+    h, w = frames.shape[1:3]
+    if not _PINNED or _PINNED[0].shape[2:] != (h, w):
+        # sized to the video's letterbox (rect for PyTorch weights); re-made when it changes
+        _PINNED[:] = [
+            torch.empty((BATCH_SIZE, 3, h, w), dtype=torch.uint8, pin_memory=True)
+            for _ in range(2)
+        ]
+    if _H2D_STREAM is None:
+        _H2D_STREAM = torch.cuda.Stream()
+
+    # NHWC BGR -> NCHW RGB, written directly into the pinned buffer
+    buf = _PINNED[slot][: len(frames)]
+    np.copyto(buf.numpy(), frames[:, :, :, ::-1].transpose(0, 3, 1, 2))
+
+    with torch.cuda.stream(_H2D_STREAM):
+        x = buf.to("cuda", non_blocking=True).to(dtype).div_(255)
+        ready = torch.cuda.Event()
+        ready.record()
+    # x is consumed on the inference stream; keep the allocator from recycling it early
+    x.record_stream(torch.cuda.default_stream())
+    return x, ready
+
+
+def detect_batch(model, pending: List[Tuple[int, Any]], staged, dets: Detections, lb: Letterbox) -> None:
+    if isinstance(staged, tuple):
+        source, ready = staged
+        torch.cuda.current_stream().wait_event(ready)
+    else:
+        source = staged
+
+    # One predict() over the whole batch; Ultralytics returns one Results per input, in order.
+    # NMS already runs on the device inside predict().
+    results = model.predict(source=source, **PREDICT_ARGS)
+
+    # Boxes come back in one device->host copy per batch: every frame's rows are
+    # concatenated on the device first. (With tensor input, Ultralytics' postprocess
+    # also copies the input batch back to host arrays for Results.orig_img; that
+    # copy is inside predict() and not avoidable from here.)
+    # Row layout: x1, y1, x2, y2, conf, cls.
+    counts: List[int] = []
+    data = []
+    for r in results:
+        boxes = r.boxes
+        n = 0 if boxes is None else boxes.shape[0]
+        counts.append(n)
+        if n:
+            data.append(boxes.data)
+    if data:
+        rows = torch.cat(data).float().cpu().numpy()
+        rows[:, :4] = lb.unmap(rows[:, :4])
+    else:
+        # nothing detected in the whole batch: no concat, no box copy
+        rows = np.empty((0, 6), np.float32)
+
+    # pending entries without a frame are near-duplicates of the last inferred frame
+    n_iter = iter(counts)
+    i = 0
+    for frame_idx, frame in pending:
+        if frame is None:
+            dets.repeat(frame_idx)
+            continue
+        n = next(n_iter)
+        # views into the batch array, no per-frame copies
+        dets.add(frame_idx, rows[i:i + n, :6])
+        i += n
+
+
+def detect_all(model, reader, dets: Detections, lb: Letterbox) -> None:
+    """
+    Batched inference over the decoded frames, one batch in flight at a time.
+
+    Frames are decoded into the two _RING slabs in turn; predict() runs on the
+    _GPU thread while this thread decodes the next batch into the other slab
+    and stages it into the other pinned buffer (host pack + async H2D on the
+    copy stream), so decode, upload and the forward pass overlap. A slab is only
+    refilled after its batch finished. Batches finish in order, so dets stays in
+    frame order.
+
+    With DIFF_THRESHOLD set, frames that barely differ from the last inferred one
+    ride along in the batch as (frame_idx, None) and copy its detections; their
+    slab position is reused by the next frame.
+    """
+    global _RING
+    if _RING is None or _RING.shape[2:4] != (lb.out_h, lb.out_w):
+        _RING = np.empty((2, BATCH_SIZE, lb.out_h, lb.out_w, 3), dtype=np.uint8)
+
+    inflight = None
+    slot = 0
+    pending: List[Tuple[int, Any]] = []
+    n_infer = 0
+    prev = None
+    step = max(YOLO_IMGSZ // 64, 1)
+    # diff only the picture, not the constant letterbox padding (which would dilute the
+    # mean and make DIFF_THRESHOLD depend on the aspect ratio)
+    content = (slice(lb.pad_y, lb.pad_y + lb.nh, step), slice(lb.pad_x, lb.pad_x + lb.nw, step))
+    dtype = input_dtype(model)
+
+    def submit() -> None:
+        nonlocal inflight, slot, pending, n_infer
+        staged = stage_batch(_RING[slot, :n_infer], slot, dtype)
+        if inflight is not None:
+            inflight.result()
+        inflight = _GPU.submit(detect_batch, model, pending, staged, dets, lb)
+        slot ^= 1
+        pending = []
+        n_infer = 0
+
+    try:
+        while True:
+            frame = _RING[slot, n_infer]
+            frame_idx = reader.readinto(frame)
+            if frame_idx is None:
+                break
+
+            if DIFF_THRESHOLD > 0:
+                small = frame[content].astype(np.int16)
+                if prev is not None and np.abs(small - prev).mean() < DIFF_THRESHOLD:
+                    pending.append((frame_idx, None))
+                    continue
+                prev = small
+
+            pending.append((frame_idx, frame))
+            n_infer += 1
+            if n_infer >= BATCH_SIZE:
+                submit()
+
+        if n_infer:
+            submit()
+        elif pending:
+            # only duplicates left: nothing to infer, copy once the last batch is in
+            if inflight is not None:
+                inflight.result()
+            for frame_idx, _ in pending:
+                dets.repeat(frame_idx)
+    finally:
+        if inflight is not None:
+            wait([inflight])
+    if inflight is not None:
+        inflight.result()
+
+
 def fail_job(s3, job: Dict[str, Any], message: str) -> Dict[str, Any]:
     job["status"] = "failed"
     job["error"] = message
@@ -88,80 +727,93 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
     if not job_id or not video_key:
         return {"status": "failed", "error": "job_id and video_key are required in event.input"}
 
-    s3 = s3_client()
+    s3 = get_s3()
 
     try:
         job = load_job(s3, job_id)
     except Exception as e:
         return {"status": "failed", "job_id": job_id, "error": f"Unable to load job from R2: {e}"}
 
-    # Mark running
+    # Mark running without blocking on the PUT; every later save_job waits for it
+    # first, so "running" can never land after a terminal status.
     job["status"] = "running"
     job["error"] = None
-    save_job(s3, job)
+    running = _EXECUTOR.submit(save_job, s3, dict(job))
 
     try:
-        model = YOLO(MODEL_NAME)
-
         with tempfile.TemporaryDirectory() as td:
             video_path = os.path.join(td, "video.mp4")
-            s3.download_file(R2_BUCKET, video_key, video_path)
-
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                return fail_job(s3, job, "OpenCV could not open the video file")
-
-            frame_idx = 0
-            frames: List[Dict[str, Any]] = []
-
-            while True:
-                ok, frame = cap.read()
-                if not ok:
-                    break
-
-                if frame_idx % FRAME_STRIDE == 0:
-                    results = model.predict(
-                        source=frame,
-                        verbose=False,
-                        conf=YOLO_CONF,
-                        iou=YOLO_IOU,
-                        max_det=YOLO_MAX_DET,
-                    )
-
-                    frame_out: List[Dict[str, Any]] = []
-                    for r in results:
-                        if getattr(r, "boxes", None) is None:
-                            continue
-                        for b in r.boxes:
-                            cls = int(b.cls.item())
-                            conf = float(b.conf.item())
-                            xyxy = [float(x) for x in b.xyxy[0].tolist()]
-                            frame_out.append({"class": cls, "conf": conf, "xyxy": xyxy})
-
-                    frames.append({"frame": frame_idx, "detections": frame_out})
-
-                frame_idx += 1
-
-            cap.release()
+            download = _EXECUTOR.submit(s3.download_file, R2_BUCKET, video_key, video_path, Config=DOWNLOAD_CONFIG)
+            try:
+                # load + warm the model while the download runs
+                model = get_model()
+                warm_up(model)
+            finally:
+                # never leave the temp dir while the download may still be writing into it
+                wait([download])
+            download.result()
+
+            try:
+                width, height = video_size(video_path)
+            except Exception:
+                wait([running])
+                return fail_job(s3, job, "Could not read a video stream from the file")
+
+            dets = Detections()
+
+            # frames arrive already letterboxed to the model input; boxes are mapped back
+            lb = Letterbox(width, height, YOLO_IMGSZ, model_stride(model))
+            with open_frames(video_path, FRAME_STRIDE, lb) as reader:
+                detect_all(model, reader, dets, lb)
 
         out = {
             "job_id": job_id,
             "video_key": video_key,
             "frame_stride": FRAME_STRIDE,
-            "yolo": {"model": MODEL_NAME, "conf": YOLO_CONF, "iou": YOLO_IOU, "max_det": YOLO_MAX_DET},
-            "frames": frames,
+            "diff_threshold": DIFF_THRESHOLD,
+            "yolo": {
+                "model": MODEL_NAME,
+                "engine": export_precision() if use_export() else None,
+                "conf": YOLO_CONF,
+                "iou": YOLO_IOU,
+                "max_det": YOLO_MAX_DET,
+                "batch": BATCH_SIZE,
+            },
         }
-
-        write_results(s3, job_id, out)
+        if RESULTS_FORMAT == "parquet":
+            out["format"] = "parquet"
+            out["detections_key"] = write_detections_parquet(s3, job_id, dets)
+            out["sampled_frames"] = dets.frame_ids
+            out["detections_count"] = sum(dets.counts)
+        else:
+            out["frames"] = dets.to_frames()
 
         job["status"] = "completed"
         job["results_key"] = results_key(job_id)
+        job["results_key_alt"] = results_key_alt(job_id)
+        job["finished_at"] = time.time()
         job["error"] = None
-        save_job(s3, job)
+
+        # results (under both keys) and the completed job blob go up in parallel;
+        # readers that see "completed" before a results object exists get a 202
+        body = encode_results(out)
+        # ordering only: the "running" PUT is best-effort and must not fail a finished job
+        wait([running])
+        if running.exception() is not None:
+            print(f"[handler] Could not save running status for {job_id}: {running.exception()}")
+        writes = [
+            _EXECUTOR.submit(write_results, s3, job["results_key"], body),
+            _EXECUTOR.submit(write_results, s3, job["results_key_alt"], body),
+            _EXECUTOR.submit(save_job, s3, job),
+        ]
+        wait(writes)
+        for f in writes:
+            f.result()
 
         return {"status": "completed", "job_id": job_id, "results_key": job["results_key"]}
 
     except Exception as e:
+        wait([running])
         return fail_job(s3, job, f"Worker exception: {e}")
 
 